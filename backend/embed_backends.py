@@ -31,11 +31,38 @@ class FastEmbedder(Embedder):
         self.model_name = model_name or os.getenv(
             "EMBED_MODEL_NAME", "BAAI/bge-small-en-v1.5"
         )
-        self.model = _FastEmbed(model_name=self.model_name)
+        # why: lazy_load defers weight loading so parallel workers don't
+        # inherit an already-initialized session from the parent process.
+        # Providers/threads are pinned from env so the ONNX session matches
+        # the container's CPU/GPU allocation instead of runtime guessing;
+        # EMBED_THREADS=0 leaves thread count to onnxruntime.
+        self.model = _FastEmbed(
+            model_name=self.model_name,
+            threads=int(os.getenv("EMBED_THREADS", "0")) or None,
+            providers=os.getenv("EMBED_PROVIDERS", "CPUExecutionProvider").split(","),
+            lazy_load=True,
+        )
+        self.batch_size = int(os.getenv("EMBED_BATCH", "256"))
+        # 0 = auto-detect cores; None disables worker processes entirely
+        self.parallel = int(os.getenv("EMBED_PARALLEL", "0"))
 
     def embed(self, texts: List[str]) -> np.ndarray:
-        vecs = list(self.model.embed(texts))  # generator -> list
-        return np.asarray(vecs, dtype=np.float32)
+        gen = self.model.embed(texts, batch_size=self.batch_size, parallel=self.parallel)
+        # why: fill a pre-allocated matrix straight from the generator instead
+        # of list-of-arrays + asarray, which copies the whole output once more.
+        first = next(gen, None)
+        if first is None:
+            return np.empty((0, 0), dtype=np.float32)
+        out = np.empty((len(texts), first.shape[-1]), dtype=np.float32)
+        out[0] = first
+        for i, v in enumerate(gen, 1):
+            out[i] = v
+        return out
+
+    def embed_query(self, text: str) -> np.ndarray:
+        # why: a single query never amortizes worker spin-up; stay in-process.
+        vecs = list(self.model.embed([text], parallel=None))
+        return np.asarray(vecs, dtype=np.float32)[0]
 
 
 class GeminiEmbedder(Embedder):
@@ -2,14 +2,21 @@
 from __future__ import annotations
 
 import argparse
-import json
 import os
 from pathlib import Path
 from typing import List
 
 import numpy as np
+import orjson
 from dotenv import load_dotenv
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
+
 from rag_index import ingest_folder, IngestedChunk
 from embed_backends import build_embedder
 
@@ -18,11 +25,77 @@ def ensure_parent(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
 
-def write_jsonl_index(chunks: List[IngestedChunk], vectors: np.ndarray, index_path: Path) -> None:
-    """Write one JSON object per line: metadata + vector list."""
+def iter_batches(texts: List[str], max_batch_tokens: int, max_items: int):
+    """
+    Yield (start, end) slice bounds, greedily packing texts until the batch
+    reaches ~max_batch_tokens (est. 4 chars/token, as in rag_index) or
+    max_items. why: fixed-size batches starve the model on short chunks and
+    spike memory on long ones; a token budget keeps work per call steady.
+    """
+    start, running = 0, 0
+    for i, t in enumerate(texts):
+        tokens = max(1, len(t) // 4)
+        if i > start and (running + tokens > max_batch_tokens or i - start >= max_items):
+            yield start, i
+            start, running = i, 0
+        running += tokens
+    if start < len(texts):
+        yield start, len(texts)
+
+
+# Length-bucket boundaries (chars); batches drawn from one bucket are
+# near-uniform in length, minimizing padding waste in the ONNX encoder.
+_BUCKET_BOUNDS = (128, 256, 512)
+
+
+def embed_texts_bucketed(
+    texts: List[str],
+    embedder,
+    max_batch_tokens: int,
+    max_items: int,
+) -> np.ndarray:
+    """
+    Embed texts grouped into length buckets, scatter-writing rows back into
+    a pre-allocated matrix so the returned order matches the input order.
+    """
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    order = np.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    bounds = [0]
+    bounds += [int(np.searchsorted(sorted_lengths, b)) for b in _BUCKET_BOUNDS]
+    bounds.append(len(texts))
+
+    out: np.ndarray | None = None
+    done = 0
+    for b0, b1 in zip(bounds, bounds[1:]):
+        idx = order[b0:b1]
+        if idx.size == 0:
+            continue
+        bucket_texts = [texts[i] for i in idx]
+        for lo, hi in iter_batches(bucket_texts, max_batch_tokens, max_items):
+            v = embedder.embed(bucket_texts[lo:hi])
+            if out is None:
+                out = np.empty((len(texts), v.shape[1]), dtype=np.float32)
+            out[idx[lo:hi]] = v
+            done += hi - lo
+            print(f"[ingest] Embedded {done}/{len(texts)}")
+    if out is None:
+        out = np.empty((0, 0), dtype=np.float32)
+    return out
+
+
+def write_npy_index(chunks: List[IngestedChunk], vectors: np.ndarray, index_path: Path) -> None:
+    """
+    Write vectors as one L2-normalized float32 .npy plus a JSONL metadata
+    sidecar (<stem>.meta.jsonl) without the vector field.
+    why: the server mmaps the .npy at load, so startup skips float parsing.
+    """
     ensure_parent(index_path)
-    with index_path.open("w", encoding="utf-8") as f:
-        for ch, vec in zip(chunks, vectors):
+    mat = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8
+    np.save(index_path, mat / norms)
+    with index_path.with_suffix(".meta.jsonl").open("wb") as f:
+        for ch in chunks:
             rec = {
                 "id": ch.id,
                 "doc_id": ch.doc_id,
@@ -30,9 +103,101 @@ def write_jsonl_index(chunks: List[IngestedChunk], vectors: np.ndarray, index_pa
                 "kind": ch.kind,
                 "path": ch.path,
                 "text": ch.text,
-                "vector": vec.tolist(),
             }
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.write(orjson.dumps(rec, option=_ORJSON_OPTS))
+
+
+def convert_jsonl_to_npy(jsonl_path: Path, npy_path: Path) -> None:
+    """One-time migration of an existing JSONL index to the .npy format."""
+    from retriever import SimpleIndex
+
+    # Force float32: the migration must not inherit the server's INDEX_DTYPE
+    # (an int8-quantized mat saved here would be re-quantized at load and
+    # saturate to ±127); the serving dtype is applied by from_npy instead.
+    index = SimpleIndex.from_jsonl(Path(jsonl_path), dtype="float32")
+    npy_path = Path(npy_path)
+    ensure_parent(npy_path)
+    np.save(npy_path, np.asarray(index.mat, dtype=np.float32))  # already normalized
+    with npy_path.with_suffix(".meta.jsonl").open("wb") as f:
+        for i in range(index.size()):
+            rec = {
+                "id": index.ids[i],
+                "doc_id": index.doc_ids[i],
+                "doc_title": index.titles[i],
+                "kind": index.kinds[i],
+                "path": index.paths[i],
+                "text": index.texts[i],
+            }
+            f.write(orjson.dumps(rec, option=_ORJSON_OPTS))
+
+
+def write_parquet_index(chunks: List[IngestedChunk], vectors: np.ndarray, index_path: Path) -> None:
+    """
+    Write metadata columns + embeddings as a FixedSizeList column.
+    why: the embedding column is built zero-copy from the contiguous float32
+    matrix — no per-row tolist() boxing, and far fewer bytes on disk than JSONL.
+    """
+    if pa is None:
+        raise RuntimeError(
+            "pyarrow is not installed. Ensure it's in requirements and installed."
+        )
+    ensure_parent(index_path)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    flat = pa.array(vectors.ravel(), type=pa.float32())  # view, no copy
+    emb_col = pa.FixedSizeListArray.from_arrays(flat, vectors.shape[1])
+    table = pa.table(
+        {
+            "id": [c.id for c in chunks],
+            "doc_id": [c.doc_id for c in chunks],
+            "doc_title": [c.doc_title for c in chunks],
+            "kind": [c.kind for c in chunks],
+            "path": [c.path for c in chunks],
+            "text": [c.text for c in chunks],
+            "embedding": emb_col,
+        }
+    )
+    pq.write_table(table, index_path)
+
+
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE
+
+
+def write_jsonl_header(f) -> None:
+    """
+    First line of a JSONL index: file-level metadata (no "id" key marks it
+    as a header). "normalized" lets the loader skip re-normalizing N×D rows.
+    """
+    f.write(orjson.dumps({"normalized": True}, option=_ORJSON_OPTS))
+
+
+def append_jsonl(f, chunks: List[IngestedChunk], vectors: np.ndarray) -> None:
+    """
+    Append one JSON object per line to an already-open binary file.
+    why: orjson serializes the ndarray row directly (OPT_SERIALIZE_NUMPY),
+    skipping the per-float tolist() boxing of the stdlib encoder.
+    """
+    # Normalize per batch so the header's "normalized": true holds.
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8)
+    for ch, vec in zip(chunks, vectors):
+        rec = {
+            "id": ch.id,
+            "doc_id": ch.doc_id,
+            "doc_title": ch.doc_title,
+            "kind": ch.kind,
+            "path": ch.path,
+            "text": ch.text,
+            "vector": vec,
+        }
+        f.write(orjson.dumps(rec, option=_ORJSON_OPTS))
+
+
+def write_jsonl_index(chunks: List[IngestedChunk], vectors: np.ndarray, index_path: Path) -> None:
+    """Write a full JSONL index in one go (see append_jsonl for the format)."""
+    ensure_parent(index_path)
+    with index_path.open("wb") as f:
+        write_jsonl_header(f)
+        append_jsonl(f, chunks, vectors)
 
 
 def main() -> None:
@@ -42,10 +207,11 @@ def main() -> None:
 
     parser = argparse.ArgumentParser(description="Ingest PDFs/DOCX → JSONL index with embeddings.")
     parser.add_argument("--docs-dir", default=os.getenv("DOCS_DIR", "./docs"), help="Folder with source PDFs/DOCX.")
-    parser.add_argument("--index-path", default=os.getenv("INDEX_PATH", "./data/index.jsonl"), help="Output JSONL index.")
+    parser.add_argument("--index-path", default=os.getenv("INDEX_PATH", "./data/index.jsonl"), help="Output index (.jsonl or .parquet).")
     parser.add_argument("--target-tokens", type=int, default=1000, help="Approx tokens per chunk.")
     parser.add_argument("--overlap-tokens", type=int, default=120, help="Approx overlap tokens between chunks.")
-    parser.add_argument("--batch", type=int, default=256, help="Embedding batch size.")
+    parser.add_argument("--batch", type=int, default=512, help="Max chunks per embedding batch.")
+    parser.add_argument("--max-batch-tokens", type=int, default=16384, help="Approx token budget per embedding batch.")
     args = parser.parse_args()
 
     docs_dir = Path(args.docs_dir).resolve()
@@ -73,21 +239,28 @@ def main() -> None:
     embedder = build_embedder()
 
     texts = [c.text for c in chunks]
-    # Simple batching to keep memory modest for larger corpora
-    vecs: List[np.ndarray] = []
-    for i in range(0, len(texts), args.batch):
-        batch = texts[i : i + args.batch]
-        v = embedder.embed(batch)
-        if not isinstance(v, np.ndarray):
-            v = np.asarray(v, dtype=np.float32)
-        vecs.append(v.astype(np.float32))
-        print(f"[ingest] Embedded {min(i + len(batch), len(texts))}/{len(texts)}")
-
-    vectors = np.vstack(vecs).astype(np.float32)
-    assert vectors.shape[0] == len(chunks), "vector count != chunk count"
-
-    print(f"[ingest] Writing index → {index_path} (records: {len(chunks)}, dim: {vectors.shape[1]})")
-    write_jsonl_index(chunks, vectors, index_path)
+
+    suffix = index_path.suffix.lower()
+    if suffix in (".parquet", ".npy"):
+        # These formats need the full matrix anyway, so bucket by length for
+        # near-uniform batches and scatter back into input order.
+        vectors = embed_texts_bucketed(texts, embedder, args.max_batch_tokens, args.batch)
+        assert vectors.shape[0] == len(chunks), "vector count != chunk count"
+        print(f"[ingest] Writing index → {index_path} (records: {len(chunks)}, dim: {vectors.shape[1]})")
+        if suffix == ".npy":
+            write_npy_index(chunks, vectors, index_path)
+        else:
+            write_parquet_index(chunks, vectors, index_path)
+    else:
+        # Stream embed → write per batch so only the current batch's vectors
+        # are live; peak memory drops from O(N·d) to O(batch·d).
+        ensure_parent(index_path)
+        print(f"[ingest] Writing index → {index_path} (records: {len(chunks)})")
+        with index_path.open("wb") as f:
+            write_jsonl_header(f)
+            for lo, hi in iter_batches(texts, args.max_batch_tokens, args.batch):
+                append_jsonl(f, chunks[lo:hi], embedder.embed(texts[lo:hi]))
+                print(f"[ingest] Embedded {hi}/{len(texts)}")
     print("[ingest] Done.")
 
 
@@ -4,25 +4,40 @@ import os
 from pathlib import Path
 import asyncio
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from google import genai
 from google.genai import types
 
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except Exception:
+    FileSystemEventHandler = object
+    Observer = None
+
 # RAG imports
 from embed_backends import build_embedder
-from retriever import SimpleIndex
+from retriever import SimpleIndex, maybe_wrap_faiss
 
 # ---- Load .env from THIS folder ----
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(BASE_DIR / ".env")
 
 # ---- FastAPI app & CORS ----
-app = FastAPI(title="ChatGPT-style Backend (Gemini + Simple RAG)")
+# why: orjson serializes trace-heavy ChatResponse payloads much faster than stdlib json
+app = FastAPI(
+    title="ChatGPT-style Backend (Gemini + Simple RAG)",
+    default_response_class=ORJSONResponse,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -196,22 +211,140 @@ INDEX_PATH = Path(os.getenv("INDEX_PATH", "./data/index.jsonl")).resolve()
 TOP_K = int(os.getenv("TOP_K", "6"))
 MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "4000"))
 MODEL_TIMEOUT_SECS = int(os.getenv("MODEL_TIMEOUT_SECS", "45"))
+MIN_QUERY_CHARS = int(os.getenv("MIN_QUERY_CHARS", "8"))
+
+# Dedicated pool for blocking Gemini calls.
+# why: the default executor is shared app-wide and capped at min(32, cpu+4);
+# stalled LLM calls would otherwise starve every other blocking task.
+_LLM_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_CONCURRENCY", "16")), thread_name_prefix="gemini"
+)
 
 # ---- RAG globals (loaded on startup) ----
 _embedder = None
 _index = None
 _INDEX_MTIME: float | None = None
 
+# ---- Query-embedding micro-batcher ----
+class QueryEmbedBatcher:
+    """
+    Coalesces query-embedding requests arriving within a short window into a
+    single embedder.embed() call and fans results back out by position.
+    why: per-query embed calls pay full fixed ONNX overhead; batching
+    amortizes it under concurrent chat load.
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def embed_one(self, text: str):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            texts = [t for t, _ in batch]
+            try:
+                vecs = await asyncio.to_thread(_embedder.embed, texts)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), vec in zip(batch, vecs):
+                if not fut.done():
+                    fut.set_result(vec)
+
+_query_batcher = QueryEmbedBatcher(
+    max_batch=int(os.getenv("QUERY_EMBED_MAX_BATCH", "32")),
+    max_wait_ms=float(os.getenv("QUERY_EMBED_MAX_WAIT_MS", "5")),
+)
+
 def _load_index() -> None:
     """Reload RAM index and capture mtime."""
     global _index, _INDEX_MTIME
-    _index = SimpleIndex.from_jsonl(INDEX_PATH)
+    suffix = INDEX_PATH.suffix.lower()
+    if suffix == ".parquet":
+        _index = SimpleIndex.from_parquet(INDEX_PATH)
+    elif suffix == ".npy":
+        _index = SimpleIndex.from_npy(INDEX_PATH)
+    else:
+        _index = SimpleIndex.from_jsonl(INDEX_PATH)
+    # Large corpora get an ANN (HNSW) search path; small ones stay brute-force.
+    _index = maybe_wrap_faiss(_index, INDEX_PATH.with_suffix(".faiss"))
     _INDEX_MTIME = INDEX_PATH.stat().st_mtime if INDEX_PATH.exists() else None
     print(f"[index] loaded {_index.size() if _index else 0} chunks from {INDEX_PATH}")
 
+# Filesystem watcher for the index file.
+# why: a per-request stat() syscall sat on the /api/chat hot path; an inotify
+# watcher turns the freshness check into a plain flag read.
+_RELOAD_PENDING = False
+_observer = None
+
+class _IndexChangeHandler(FileSystemEventHandler):
+    # Mutation events only. why: watchdog also emits opened/closed-no-write
+    # for pure reads — including _load_index's own read of the file — which
+    # would re-arm the flag after every reload and turn each chat request
+    # into a full index re-parse.
+    _MUTATIONS = ("modified", "created", "moved")
+
+    def on_any_event(self, event) -> None:
+        global _RELOAD_PENDING
+        if event.event_type not in self._MUTATIONS:
+            return
+        paths = (getattr(event, "src_path", ""), getattr(event, "dest_path", ""))
+        if str(INDEX_PATH) in paths:
+            _RELOAD_PENDING = True
+
+def _start_index_watcher() -> None:
+    global _observer
+    if Observer is None:
+        return
+    try:
+        INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _observer = Observer()
+        _observer.daemon = True  # don't block interpreter shutdown
+        _observer.schedule(_IndexChangeHandler(), str(INDEX_PATH.parent))
+        _observer.start()
+    except Exception as e:
+        print(f"[startup] index watcher unavailable ({e}); falling back to mtime polling")
+        _observer = None
+
 def _ensure_index_fresh() -> None:
-    """Hot-reload if index.jsonl changed on disk (after running ingest.py)."""
-    global _INDEX_MTIME
+    """Hot-reload if the index changed on disk (after running ingest.py)."""
+    global _RELOAD_PENDING, _INDEX_MTIME
+    if _observer is not None:
+        if _RELOAD_PENDING:
+            _RELOAD_PENDING = False
+            _load_index()
+        return
+    # Fallback when watchdog isn't available: poll mtime.
     try:
         mtime = INDEX_PATH.stat().st_mtime
     except FileNotFoundError:
@@ -219,65 +352,115 @@ def _ensure_index_fresh() -> None:
     if mtime != _INDEX_MTIME:
         _load_index()
 
-@app.on_event("startup")
-def _on_startup() -> None:
-    """Warm up embedder (avoid first-request hang) and load index."""
-    global _embedder
-    _embedder = build_embedder()
+_embedder_ready = False
+
+def _warmup_embedder() -> None:
+    """Force model weights download/init; first real query then runs warm."""
+    global _embedder_ready
     try:
-        _ = _embedder.embed(["warmup"])  # why: force model weights download/init now
+        _ = _embedder.embed(["x"])
+        _embedder_ready = True
         print("[startup] embedder ready")
     except Exception as e:
         print(f"[startup] embedder warmup failed: {e}")
+
+@app.on_event("startup")
+async def _on_startup() -> None:
+    """Build embedder, warm it up (in the background by default), load index."""
+    global _embedder
+    _embedder = build_embedder()
+    # why: the warmup forward pass used to block startup; running it in a
+    # thread lets the server accept traffic immediately. WARMUP_BLOCKING=1
+    # restores the old behavior.
+    if os.getenv("WARMUP_BLOCKING", "0") == "1":
+        _warmup_embedder()
+    else:
+        asyncio.get_running_loop().create_task(asyncio.to_thread(_warmup_embedder))
     _load_index()
+    _start_index_watcher()
+    _query_batcher.start()
+
+@app.on_event("shutdown")
+async def _on_shutdown() -> None:
+    await _query_batcher.stop()
+    if _observer is not None:
+        _observer.stop()
+    _LLM_POOL.shutdown(wait=False, cancel_futures=True)
 
 # ---- Timestamp & trace ----
 def now_iso() -> str:
-    return datetime.utcnow().isoformat() + "Z"
+    # why: utcnow() is deprecated; millisecond precision is plenty for traces
+    # and formats fewer digits per event.
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
 
 def make_trace_event(label: str, detail: str = "") -> TraceEvent:
-    return TraceEvent(label=label, detail=detail, timestamp=now_iso())
+    # why: model_construct skips validation; these fields are server-produced
+    # strings, and several events are created per request.
+    return TraceEvent.model_construct(label=label, detail=detail, timestamp=now_iso())
 
 # ---- Retrieval helper (context budget) ----
-def build_context_block(query: str) -> tuple[str, list[str]]:
+# Precompiled template pieces; joined once at the bytes level per request.
+_CTX_HEADER = b"## Context Materials\n\n"
+_CTX_SEP = b"\n\n---\n\n"
+
+_QVEC_CACHE: OrderedDict = OrderedDict()
+_QVEC_CACHE_MAX = 1024
+
+async def _cached_query_vec(query: str):
+    """Embed a normalized query once; repeats/retries skip the ONNX forward."""
+    hit = _QVEC_CACHE.get(query)
+    if hit is not None:
+        _QVEC_CACHE.move_to_end(query)
+        return hit
+    vec = await _query_batcher.embed_one(query)
+    _QVEC_CACHE[query] = vec
+    if len(_QVEC_CACHE) > _QVEC_CACHE_MAX:
+        _QVEC_CACHE.popitem(last=False)
+    return vec
+
+async def build_context_block(query: str) -> tuple[str, list[str]]:
     if _index is None or _index.size() == 0 or not query.strip():
         return "", []
-    recs = _index.search(query, _embedder, top_k=TOP_K)
+    qv = await _cached_query_vec(query.strip().lower())
+    recs = _index.search(query, _embedder, top_k=TOP_K, query_vec=qv)
 
-    seen, picked, sources = set(), [], []
+    # Single-pass dedup by title; setdefault keeps the highest-ranked record
+    # per doc and dict ordering preserves rank order.
+    by_title: dict = {}
     for r in recs:
-        if r.doc_title in seen:
-            continue
-        seen.add(r.doc_title)
-        picked.append(r)
-        sources.append(r.doc_title)
-
+        by_title.setdefault(r.doc_title, r)
+    picked = list(by_title.values())
     if not picked:
         return "", []
+    sources = [r.doc_title for r in picked]
 
     budget = MAX_CONTEXT_CHARS
-    lines = []
+    lines_b = []
     for r in picked:
         if budget <= 0:
             break
-        snippet = r.text
-        if len(snippet) > budget:
-            snippet = snippet[:budget]
-        lines.append(f"### {r.doc_title} ({r.kind})\n{snippet}")
+        snippet = r.text if len(r.text) <= budget else r.text[:budget]
+        lines_b.append(f"### {r.doc_title} ({r.kind})\n".encode() + snippet.encode())
         budget -= len(snippet)
 
-    context_md = "## Context Materials\n\n" + "\n\n---\n\n".join(lines)
+    # Single bytes-level join + one decode, instead of stacking str copies.
+    context_md = (_CTX_HEADER + _CTX_SEP.join(lines_b)).decode()
     return context_md, sources
 
 # ---- LLM call (thread + timeout + fallback) ----
-async def call_llm(messages: List[Message]) -> tuple[str, List[TraceEvent]]:
-    trace: List[TraceEvent] = []
-    trace.append(make_trace_event("received_request", f"Got {len(messages)} message(s)."))
-
-    system_parts = [DEFAULT_SYSTEM_PROMPT]
-    system_parts.extend(m.content for m in messages if m.role == "system")
-    system_instructions = "\n\n".join(system_parts)
-    trace.append(make_trace_event("build_system_instructions", "Assembled system instruction."))
+# why: DEFAULT_SYSTEM_PROMPT is >7 KB; without extra system messages there is
+# no reason to re-concatenate it and rebuild the config on every request.
+_BASE_CONFIG = types.GenerateContentConfig(system_instruction=DEFAULT_SYSTEM_PROMPT)
+
+def _build_gemini_request(messages: List[Message]) -> tuple[List[types.Content], types.GenerateContentConfig]:
+    """Translate chat messages into Gemini contents + config."""
+    extra_system = [m.content for m in messages if m.role == "system"]
+    if extra_system:
+        gen_config = types.GenerateContentConfig(
+            system_instruction="\n\n".join([DEFAULT_SYSTEM_PROMPT, *extra_system])
+        )
+    else:
+        gen_config = _BASE_CONFIG
 
     chat_contents: List[types.Content] = []
     for m in messages:
@@ -286,7 +469,14 @@ async def call_llm(messages: List[Message]) -> tuple[str, List[TraceEvent]]:
         gemini_role = "user" if m.role == "user" else "model"
         chat_contents.append(types.Content(role=gemini_role, parts=[types.Part.from_text(text=m.content)]))
 
-    gen_config = types.GenerateContentConfig(system_instruction=system_instructions)
+    return chat_contents, gen_config
+
+async def call_llm(messages: List[Message]) -> tuple[str, List[TraceEvent]]:
+    trace: List[TraceEvent] = []
+    trace.append(make_trace_event("received_request", f"Got {len(messages)} message(s)."))
+
+    chat_contents, gen_config = _build_gemini_request(messages)
+    trace.append(make_trace_event("build_system_instructions", "Assembled system instruction."))
 
     loop = asyncio.get_running_loop()
 
@@ -300,14 +490,14 @@ async def call_llm(messages: List[Message]) -> tuple[str, List[TraceEvent]]:
     trace.append(make_trace_event("call_model_start", f"Calling model {GEMINI_MODEL} with timeout {MODEL_TIMEOUT_SECS}s..."))
     try:
         response = await asyncio.wait_for(
-            loop.run_in_executor(None, lambda: _do_call(GEMINI_MODEL)),
+            loop.run_in_executor(_LLM_POOL, lambda: _do_call(GEMINI_MODEL)),
             timeout=MODEL_TIMEOUT_SECS,
         )
     except asyncio.TimeoutError:
         trace.append(make_trace_event("call_model_timeout", f"Timed out after {MODEL_TIMEOUT_SECS}s; trying fallback {GEMINI_FAST_MODEL}..."))
         try:
             response = await asyncio.wait_for(
-                loop.run_in_executor(None, lambda: _do_call(GEMINI_FAST_MODEL)),
+                loop.run_in_executor(_LLM_POOL, lambda: _do_call(GEMINI_FAST_MODEL)),
                 timeout=30,
             )
             trace.append(make_trace_event("call_model_fallback", f"Fallback {GEMINI_FAST_MODEL} succeeded."))
@@ -333,6 +523,7 @@ def healthz() -> dict:
         "docs_indexed": _index.size() if _index else 0,
         "index_path": str(INDEX_PATH),
         "model": GEMINI_MODEL,
+        "embedder_ready": _embedder_ready,
         "time": now_iso(),
     }
 
@@ -349,17 +540,21 @@ def reload_index() -> dict:
     _load_index()
     return {"ok": True, "chunks": _index.size() if _index else 0}
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat_endpoint(payload: ChatRequest) -> ChatResponse:
-    # fast ping path (dev sanity check)
+def _last_user_content(payload: ChatRequest) -> str:
     user_msgs = [m for m in payload.messages if m.role == "user"]
-    last_user = user_msgs[-1].content if user_msgs else ""
-    if last_user.strip().lower() == "ping":
-        return ChatResponse(reply="pong", trace=[make_trace_event("ping", "fast-path pong")])
-
+    return user_msgs[-1].content if user_msgs else ""
+
+async def _augment_with_context(payload: ChatRequest) -> tuple[List[Message], list[str]]:
+    """Append retrieved context as a system message; returns (messages, sources)."""
+    last_user = _last_user_content(payload).strip()
+    # why: degenerate inputs ("hi", "ok") and a cold index would still pay a
+    # full ONNX forward pass; skip retrieval outright for those.
+    if len(last_user) < MIN_QUERY_CHARS:
+        return list(payload.messages), []
     _ensure_index_fresh()
-
-    context_block, sources = build_context_block(last_user)
+    if _index is None or _index.size() == 0:
+        return list(payload.messages), []
+    context_block, sources = await build_context_block(last_user)
     augmented: List[Message] = list(payload.messages)
     if context_block:
         augmented.append(
@@ -373,12 +568,58 @@ async def chat_endpoint(payload: ChatRequest) -> ChatResponse:
                 ),
             )
         )
+    return augmented, sources
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat_endpoint(payload: ChatRequest) -> ChatResponse:
+    # fast ping path (dev sanity check)
+    if _last_user_content(payload).strip().lower() == "ping":
+        return ChatResponse.model_construct(reply="pong", trace=[make_trace_event("ping", "fast-path pong")])
 
+    augmented, sources = await _augment_with_context(payload)
     reply, trace = await call_llm(augmented)
     if sources:
         reply += "\n\n---\n_Sources consulted:_ " + ", ".join(dict.fromkeys(sources))
-    return ChatResponse(reply=reply, trace=trace)
+    # Fields are all internally produced, so skip re-validation here too.
+    return ChatResponse.model_construct(reply=reply, trace=trace)
+
+_STREAM_DONE = object()
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(payload: ChatRequest) -> StreamingResponse:
+    """
+    SSE variant of /api/chat: tokens are forwarded as they arrive, so
+    first-token latency stops being bound by total generation time.
+    Events are `data: {"delta": ...}` lines, then a final
+    `{"done": true, "sources": [...]}`.
+    """
+    augmented, sources = await _augment_with_context(payload)
+    chat_contents, gen_config = _build_gemini_request(augmented)
+    loop = asyncio.get_running_loop()
+
+    def _open_stream():
+        return gemini_client.models.generate_content_stream(
+            model=GEMINI_MODEL, contents=chat_contents, config=gen_config
+        )
+
+    async def gen():
+        try:
+            stream = await loop.run_in_executor(_LLM_POOL, _open_stream)
+            it = iter(stream)
+            while True:
+                chunk = await loop.run_in_executor(_LLM_POOL, next, it, _STREAM_DONE)
+                if chunk is _STREAM_DONE:
+                    break
+                text = getattr(chunk, "text", "") or ""
+                if text:
+                    yield b"data: " + orjson.dumps({"delta": text}) + b"\n\n"
+        except Exception as e:
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+            return
+        yield b"data: " + orjson.dumps({"done": True, "sources": list(dict.fromkeys(sources))}) + b"\n\n"
+
+    return StreamingResponse(gen(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8010, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=8010, reload=True, loop="uvloop", http="httptools")
@@ -2,13 +2,25 @@
 from __future__ import annotations
 
 import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Tuple, Iterable, Any
 
+import numpy as np
 import fitz  # PyMuPDF
 import docx  # python-docx
 
+try:
+    from blake3 import blake3 as _blake3
+except Exception:
+    _blake3 = None
+
 # Heuristic: ~4 chars ≈ 1 token for English prose
 CHARS_PER_TOKEN = 4
 
@@ -17,23 +29,63 @@ def sha256_bytes(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
 
+def fast_id(data: bytes) -> str:
+    """
+    Hex id for internal keys (doc/chunk ids), not authenticators.
+    why: these ids only need uniqueness, and BLAKE3's SIMD tree hash runs
+    several times faster than SHA-256; file-content hashes stay sha256 via
+    sha256_path since they may be exposed as stable identities.
+    """
+    if _blake3 is not None:
+        return _blake3(data).hexdigest()
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_path(path: Path) -> str:
+    """
+    Streaming file hash via hashlib.file_digest.
+    why: hashes through OpenSSL's accelerated path without materializing the
+    whole file as a bytes object first.
+    """
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+# PDF_TEXT_MODE=blocks pulls per-page block tuples and sorts them by (y, x)
+# instead of letting MuPDF reassemble full-page text. why: blocks skip the
+# per-line PyUnicode churn of "text" mode, which adds up on large PDFs;
+# "text" stays the default because it handles odd layouts more carefully.
+_PDF_TEXT_MODE = os.getenv("PDF_TEXT_MODE", "text")
+
+
 def read_pdf(path: Path) -> Tuple[str, Dict[str, Any]]:
     """
     Returns full extracted text and metadata.
     why: page-wise extraction ensures reasonable ordering without layout noise.
     """
     try:
-        data = path.read_bytes()
-        doc = fitz.open(stream=data, filetype="pdf")
+        doc = fitz.open(path)
     except Exception as e:
         raise RuntimeError(f"Failed to open PDF '{path.name}': {e}") from e
 
-    parts: List[str] = []
+    # why: writing pages into one growing buffer avoids holding every page's
+    # text twice (list + join) on large PDFs; decomposing ligatures ("fi" vs
+    # the single glyph) also suits embedding better than preserving them.
+    flags = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+    buf = io.StringIO()
     for page in doc:
-        # 'text' preserves reading order better than raw
-        parts.append(page.get_text("text"))
-    text = "\n".join(parts).strip()
-    meta = {"pages": len(doc), "sha256": sha256_bytes(data)}
+        if _PDF_TEXT_MODE == "blocks":
+            blocks = page.get_text("blocks", flags=flags)
+            blocks.sort(key=lambda b: (b[1], b[0]))  # reading order: top-down, left-right
+            for b in blocks:
+                if b[6] == 0:  # text blocks only; skip images
+                    buf.write(b[4])
+        else:
+            # 'text' preserves reading order better than raw
+            buf.write(page.get_text("text", flags=flags))
+        buf.write("\n")
+    text = buf.getvalue().strip()
+    meta = {"pages": len(doc), "sha256": sha256_path(path)}
     return text, meta
 
 
@@ -42,36 +94,32 @@ def read_docx(path: Path) -> Tuple[str, Dict[str, Any]]:
     DOCX paragraphs joined by newlines. Inline images/objects are ignored.
     """
     try:
-        data = path.read_bytes()
         d = docx.Document(path.as_posix())
     except Exception as e:
         raise RuntimeError(f"Failed to open DOCX '{path.name}': {e}") from e
 
     paras = [p.text.strip() for p in d.paragraphs if p.text and p.text.strip()]
     text = "\n".join(paras).strip()
-    meta = {"sha256": sha256_bytes(data)}
+    meta = {"sha256": sha256_path(path)}
     return text, meta
 
 
+# Runs of consecutive lines that each contain at least one non-space char;
+# whitespace-only lines act as paragraph separators. Line breaks cover the
+# same set str.splitlines() recognizes (form feeds etc. appear in PDF text).
+_LINE_BREAKS = "\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_PARA_RE = re.compile(
+    rf"(?:[^\S{_LINE_BREAKS}]*\S[^{_LINE_BREAKS}]*(?:\r\n|[{_LINE_BREAKS}])?)+"
+)
+
+
 def split_paragraphs(text: str) -> List[str]:
     """
     Lightweight paragraph splitter.
-    why: chunking along semantic-ish breaks improves retrieval quality.
-    """
-    # Collapse multiple blank lines; keep non-empty lines
-    lines = [ln.rstrip() for ln in text.splitlines()]
-    parts: List[str] = []
-    buf: List[str] = []
-    for ln in lines:
-        if ln.strip():
-            buf.append(ln)
-        else:
-            if buf:
-                parts.append(" ".join(buf).strip())
-                buf = []
-    if buf:
-        parts.append(" ".join(buf).strip())
-    return [p for p in parts if p]
+    why: chunking along semantic-ish breaks improves retrieval quality, and
+    the compiled regex keeps the line scan inside C instead of a Python loop.
+    """
+    return [" ".join(m.group(0).split()) for m in _PARA_RE.finditer(text)]
 
 
 def pack_chunks(
@@ -86,35 +134,49 @@ def pack_chunks(
     target_chars = max(200, target_tokens * CHARS_PER_TOKEN)
     overlap_chars = max(0, overlap_tokens * CHARS_PER_TOKEN)
 
-    chunks: List[str] = []
-    cur: List[str] = []
-    cur_len = 0
-
-    for p in parts:
-        p_len = len(p)
-        if cur and cur_len + p_len + 1 > target_chars:
-            chunks.append("\n".join(cur))
-            # carry tail overlap forward
-            carry: List[str] = []
-            carry_len = 0
-            for seg in reversed(cur):
-                carry.append(seg)
-                carry_len += len(seg) + 1
-                if carry_len >= overlap_chars:
-                    break
-            cur = list(reversed(carry))
-            cur_len = sum(len(x) + 1 for x in cur)
-
-        cur.append(p)
-        cur_len += p_len + 1
-
-    if cur:
-        chunks.append("\n".join(cur))
+    if not parts:
+        return []
+
+    # pref[k] = total length of parts[:k] incl. joining newlines.
+    # why: all boundary math runs on the prefix-sum array via searchsorted;
+    # only the final string joins stay in Python.
+    lens = np.fromiter((len(p) + 1 for p in parts), dtype=np.int64, count=len(parts))
+    pref = np.empty(len(parts) + 1, dtype=np.int64)
+    pref[0] = 0
+    np.cumsum(lens, out=pref[1:])
+
+    windows = _compute_windows(pref, target_chars, overlap_chars)
+    chunks = ["\n".join(parts[s:e]) for s, e in windows]
 
     # Guard: avoid empty artifacts
     return [c.strip() for c in chunks if c.strip()]
 
 
+def _compute_windows(
+    pref: np.ndarray, target_chars: int, overlap_chars: int
+) -> List[Tuple[int, int]]:
+    """
+    Compute (start, end) part-index windows: maximal runs fitting
+    target_chars, each carrying the smallest >= overlap_chars suffix of the
+    previous window (at least one part always advances).
+    """
+    n = len(pref) - 1
+    windows: List[Tuple[int, int]] = []
+    start, prev_end = 0, 0
+    while True:
+        # largest end with window size <= target_chars, forced to progress
+        e = int(np.searchsorted(pref, pref[start] + target_chars, side="right")) - 1
+        e = max(e, start + 1, prev_end + 1)
+        if e >= n:
+            windows.append((start, n))
+            return windows
+        windows.append((start, e))
+        # smallest window suffix totaling >= overlap_chars (min one part)
+        j = int(np.searchsorted(pref, pref[e] - overlap_chars, side="right")) - 1
+        start = max(start, min(j, e - 1))
+        prev_end = e
+
+
 @dataclass
 class IngestedChunk:
     id: str          # stable chunk id (sha256)
@@ -128,9 +190,24 @@ class IngestedChunk:
 def walk_docs(docs_dir: Path) -> List[Tuple[Path, str]]:
     allowed = {".pdf", ".docx"}
     items: List[Tuple[Path, str]] = []
-    for p in docs_dir.rglob("*"):
-        if p.is_file() and p.suffix.lower() in allowed:
-            items.append((p, p.suffix.lower()))
+    # why: scandir reuses the readdir d_type instead of one stat per entry
+    # and only builds Path objects for files that survive the extension
+    # filter; rglob("*") paid both costs for every entry in the tree.
+    # Entries are sorted per directory so walk order is deterministic.
+    stack = [str(docs_dir)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for e in entries:
+            if e.is_dir(follow_symlinks=False):
+                stack.append(e.path)
+            elif e.is_file():
+                ext = os.path.splitext(e.name)[1].lower()
+                if ext in allowed:
+                    items.append((Path(e.path), ext))
     return items
 
 
@@ -143,43 +220,108 @@ def parse_doc(path: Path, ext: str) -> Tuple[str, Dict[str, Any]]:
 
 
 def _doc_stable_id(path: Path, file_sha256: str) -> str:
-    return sha256_bytes((str(path.resolve()) + "|" + file_sha256).encode("utf-8"))
+    return fast_id((str(path.resolve()) + "|" + file_sha256).encode("utf-8"))
+
+
+# Parse cache: content-addressed by file sha256, so unchanged files skip
+# parsing and paragraph splitting entirely on re-ingest.
+def _cache_get_parts(cache_path: Path, sha: str) -> List[str] | None:
+    try:
+        with sqlite3.connect(str(cache_path), timeout=30) as conn:
+            row = conn.execute(
+                "SELECT parts_json FROM parse_cache WHERE sha = ?", (sha,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    except Exception:
+        return None  # a broken cache must never break ingest
+
+
+def _cache_put_parts(cache_path: Path, sha: str, parts: List[str]) -> None:
+    try:
+        with sqlite3.connect(str(cache_path), timeout=30) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache (sha TEXT PRIMARY KEY, parts_json BLOB)"
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO parse_cache (sha, parts_json) VALUES (?, ?)",
+                (sha, json.dumps(parts, ensure_ascii=False)),
+            )
+    except Exception:
+        pass
+
+
+def _ingest_one(
+    path: Path,
+    ext: str,
+    target_tokens: int,
+    overlap_tokens: int,
+    cache_path: Path | None = None,
+) -> List[IngestedChunk]:
+    """Parse + chunk a single file (runs in a worker process)."""
+    sha = sha256_path(path)
+    title = path.stem
+    doc_id = _doc_stable_id(path, sha)
+
+    # why: PDF extraction output depends on PDF_TEXT_MODE, so the mode is
+    # part of the cache key — toggling the flag must not serve paragraphs
+    # extracted under the other mode.
+    cache_key = f"{sha}:{_PDF_TEXT_MODE}" if ext == ".pdf" else sha
+    parts = _cache_get_parts(cache_path, cache_key) if cache_path else None
+    if parts is None:
+        full_text, _meta = parse_doc(path, ext)
+        parts = split_paragraphs(full_text)
+        if cache_path:
+            _cache_put_parts(cache_path, cache_key, parts)
+
+    packed = pack_chunks(parts, target_tokens=target_tokens, overlap_tokens=overlap_tokens)
+
+    chunks: List[IngestedChunk] = []
+    # why: doc_id is ASCII hex; encode it once instead of running the
+    # f-string formatter + UTF-8 codec per chunk. Same bytes, same ids.
+    doc_id_b = doc_id.encode("ascii")
+    for i, chunk_text in enumerate(packed):
+        chunk_id = fast_id(doc_id_b + b":" + str(i).encode("ascii"))
+        chunks.append(
+            IngestedChunk(
+                id=chunk_id,
+                doc_id=doc_id,
+                doc_title=title,
+                kind=ext.lstrip("."),
+                path=str(path),
+                text=chunk_text,
+            )
+        )
+    return chunks
 
 
 def ingest_folder(
     docs_dir: Path,
     target_tokens: int = 1000,
     overlap_tokens: int = 120,
+    max_workers: int | None = None,
 ) -> List[IngestedChunk]:
     """
     Parse and chunk all PDFs/DOCX in a folder. Embeddings are handled elsewhere.
+    why: parsing is CPU-bound and independent per file, so files are dispatched
+    to a process pool; results are collected in walk order to keep the index
+    deterministic.
     """
+    items = walk_docs(docs_dir)
     chunks: List[IngestedChunk] = []
-    for path, ext in walk_docs(docs_dir):
-        try:
-            full_text, meta = parse_doc(path, ext)
-        except Exception as e:
-            # Surface which file failed; continue others
-            print(f"[ingest] Skipping {path.name}: {e}")
-            continue
-
-        title = path.stem
-        doc_id = _doc_stable_id(path, meta.get("sha256", ""))
-
-        parts = split_paragraphs(full_text)
-        packed = pack_chunks(parts, target_tokens=target_tokens, overlap_tokens=overlap_tokens)
-
-        for i, chunk_text in enumerate(packed):
-            chunk_id = sha256_bytes(f"{doc_id}:{i}".encode("utf-8"))
-            chunks.append(
-                IngestedChunk(
-                    id=chunk_id,
-                    doc_id=doc_id,
-                    doc_title=title,
-                    kind=ext.lstrip("."),
-                    path=str(path),
-                    text=chunk_text,
-                )
-            )
+    if not items:
+        return chunks
+
+    cache_path = docs_dir / ".ingest_cache.sqlite"
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        futures = [
+            ex.submit(_ingest_one, path, ext, target_tokens, overlap_tokens, cache_path)
+            for path, ext in items
+        ]
+        for (path, _), fut in zip(items, futures):
+            try:
+                chunks.extend(fut.result())
+            except Exception as e:
+                # Surface which file failed; continue others
+                print(f"[ingest] Skipping {path.name}: {e}")
 
     return chunks
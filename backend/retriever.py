@@ -2,12 +2,50 @@
 from __future__ import annotations
 
 import json
+import os
 from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Tuple
 
 import numpy as np
 
+try:
+    import pyarrow.parquet as _pq
+except Exception:
+    _pq = None
+
+try:
+    import simsimd as _simsimd
+except Exception:
+    _simsimd = None
+
+try:
+    from numba import njit as _njit, prange as _prange
+except Exception:
+    _njit = None
+
+try:
+    import faiss as _faiss
+except Exception:
+    _faiss = None
+
+if _njit is not None:
+    @_njit(parallel=True, fastmath=True, cache=True)
+    def _dot_rows(mat, q):
+        # why: one streaming pass over the matrix with an LLVM-vectorized
+        # inner dot; avoids BLAS temporaries and threads across rows.
+        n, d = mat.shape
+        out = np.empty(n, dtype=np.float32)
+        for i in _prange(n):
+            s = np.float32(0.0)
+            for j in range(d):
+                s += mat[i, j] * q[j]
+            out[i] = s
+        return out
+
+# Below this row count the JIT dispatch overhead outweighs the kernel win.
+_NUMBA_MIN_ROWS = 4096
+
 from embed_backends import Embedder  # why: keep retriever backend-agnostic
 
 
@@ -22,60 +60,344 @@ class IndexRecord:
     vector: np.ndarray
 
 
+_I8_SCALE = 127.0
+
+
+def _quantize_i8(arr: np.ndarray) -> np.ndarray:
+    """Map unit-norm float32 values into int8 (symmetric, scale 127)."""
+    return np.clip(np.round(arr * _I8_SCALE), -127, 127).astype(np.int8)
+
+
 class SimpleIndex:
-    """RAM-loaded cosine index. Suitable for small/medium corpora."""
-
-    def __init__(self, records: List[IndexRecord]):
-        self.records = records
-        if records:
-            mat = np.stack([r.vector for r in records], axis=0).astype(np.float32)
-            norms = np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8
-            self.mat = mat / norms  # cosine-ready
+    """
+    RAM-loaded cosine index. Suitable for small/medium corpora.
+    Storage is struct-of-arrays: one (N, D) matrix plus parallel metadata
+    lists. why: the matrix is born in the contiguous form the dot product
+    wants, and loading skips allocating N per-record objects; IndexRecord
+    is only materialized for the handful of rows a search returns.
+    """
+
+    def __init__(
+        self,
+        mat: np.ndarray,
+        ids: List[str],
+        doc_ids: List[str],
+        titles: List[str],
+        kinds: List[str],
+        paths: List[str],
+        texts: List[str],
+        dtype: str | None = None,
+        normalized: bool = False,
+    ):
+        # why: int8 storage moves 4x fewer bytes on the memory-bound scoring
+        # pass, and SimSIMD's int8 dot uses VNNI/SDOT instructions. Unit
+        # norms make a single symmetric scale of 127 sufficient.
+        self.dtype = dtype or os.getenv("INDEX_DTYPE", "float32")
+        self.ids = ids
+        self.doc_ids = doc_ids
+        self.titles = titles
+        self.kinds = kinds
+        self.paths = paths
+        self.texts = texts
+        if mat.shape[0] and not normalized:
+            # why: scale by reciprocal norms in place; stack + divide
+            # allocated two extra N×D buffers at peak.
+            norms = np.linalg.norm(mat, axis=1)
+            norms += 1e-8
+            np.reciprocal(norms, out=norms)
+            mat *= norms[:, None]  # cosine-ready
+        if self.dtype == "int8":
+            self.mat = _quantize_i8(np.asarray(mat))
+        elif self.dtype == "float16":
+            # why: middle ground between float32 and int8 — half the bytes on
+            # the memory-bound scan with ~1e-3 score error; kernels still
+            # accumulate in float32.
+            self.mat = np.asarray(mat, dtype=np.float16)
         else:
-            self.mat = np.zeros((0, 1), dtype=np.float32)
+            self.mat = mat
+
+    @classmethod
+    def _empty(cls) -> "SimpleIndex":
+        return cls(np.zeros((0, 1), dtype=np.float32), [], [], [], [], [], [])
 
     @classmethod
-    def from_jsonl(cls, path: Path) -> "SimpleIndex":
+    def from_parquet(cls, path: Path) -> "SimpleIndex":
+        """
+        Load a Parquet index written by ingest.write_parquet_index.
+        why: embeddings live in one contiguous FixedSizeList column, so the
+        matrix comes from a single buffer view instead of parsing per-row
+        float lists.
+        """
+        if _pq is None:
+            raise RuntimeError(
+                "pyarrow is not installed. Ensure it's in requirements and installed."
+            )
         if not path.exists():
-            return cls([])
-        recs: List[IndexRecord] = []
+            return cls._empty()
+        table = _pq.read_table(path, memory_map=True)
+        emb = table.column("embedding").combine_chunks()
+        dim = emb.type.list_size
+        # Zero-copy view over the flat float32 values buffer; normalizing
+        # out of place yields the one writable copy the index needs.
+        view = np.frombuffer(emb.values.buffers()[1], dtype=np.float32).reshape(-1, dim)
+        mat = view / (np.linalg.norm(view, axis=1, keepdims=True) + 1e-8)
+        return cls(
+            mat,
+            table.column("id").to_pylist(),
+            table.column("doc_id").to_pylist(),
+            table.column("doc_title").to_pylist(),
+            table.column("kind").to_pylist(),
+            table.column("path").to_pylist(),
+            table.column("text").to_pylist(),
+            normalized=True,
+        )
+
+    @classmethod
+    def from_npy(cls, vec_path: Path, meta_path: Path | None = None) -> "SimpleIndex":
+        """
+        Load a binary index: vectors from a memory-mapped .npy (written
+        pre-normalized by ingest) plus a JSONL metadata sidecar.
+        why: np.load(mmap_mode="r") replaces per-line float parsing with a
+        zero-copy map, so startup cost is metadata-only.
+        """
+        vec_path = Path(vec_path)
+        meta_path = meta_path or vec_path.with_suffix(".meta.jsonl")
+        if not vec_path.exists() or not meta_path.exists():
+            return cls._empty()
+        mat = np.load(vec_path, mmap_mode="r")
+
+        cols: List[List[str]] = [[], [], [], [], [], []]
+        with meta_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                for col, key in zip(
+                    cols, ("id", "doc_id", "doc_title", "kind", "path", "text")
+                ):
+                    col.append(obj[key])
+        return cls(mat, *cols, normalized=True)
+
+    @classmethod
+    def from_jsonl(cls, path: Path, dtype: str | None = None) -> "SimpleIndex":
+        if not path.exists():
+            return cls._empty()
+        normalized = False
+        vecs: List[np.ndarray] = []
+        cols: List[List[str]] = [[], [], [], [], [], []]
         with path.open("r", encoding="utf-8") as f:
             for line in f:
                 if not line.strip():
                     continue
                 obj = json.loads(line)
-                vec = np.asarray(obj["vector"], dtype=np.float32)
-                recs.append(
-                    IndexRecord(
-                        id=obj["id"],
-                        doc_id=obj["doc_id"],
-                        doc_title=obj["doc_title"],
-                        kind=obj["kind"],
-                        path=obj["path"],
-                        text=obj["text"],
-                        vector=vec,
-                    )
-                )
-        return cls(recs)
+                if "id" not in obj:
+                    # Header line (see ingest.write_jsonl_header); older
+                    # indexes have none and fall through to renormalizing.
+                    normalized = bool(obj.get("normalized", False))
+                    continue
+                vecs.append(np.asarray(obj["vector"], dtype=np.float32))
+                for col, key in zip(
+                    cols, ("id", "doc_id", "doc_title", "kind", "path", "text")
+                ):
+                    col.append(obj[key])
+        if not vecs:
+            return cls._empty()
+        mat = np.empty((len(vecs), len(vecs[0])), dtype=np.float32)
+        for i, v in enumerate(vecs):
+            mat[i] = v
+        return cls(mat, *cols, dtype=dtype, normalized=normalized)
 
     def size(self) -> int:
-        return len(self.records)
+        return len(self.ids)
+
+    def _record(self, i: int) -> IndexRecord:
+        """Materialize one result row; self.mat stays the vector store."""
+        return IndexRecord(
+            id=self.ids[i],
+            doc_id=self.doc_ids[i],
+            doc_title=self.titles[i],
+            kind=self.kinds[i],
+            path=self.paths[i],
+            text=self.texts[i],
+            vector=None,
+        )
 
-    def search(self, query: str, embedder: Embedder, top_k: int = 8) -> List[IndexRecord]:
+    def search(
+        self,
+        query: str,
+        embedder: Embedder,
+        top_k: int = 8,
+        query_vec: np.ndarray | None = None,
+    ) -> List[IndexRecord]:
         """Return top-k records by cosine similarity."""
-        results, _ = self.search_with_scores(query, embedder, top_k)
+        results, _ = self.search_with_scores(query, embedder, top_k, query_vec=query_vec)
         return results
 
+    def search_many(
+        self,
+        queries: List[str],
+        embedder: Embedder,
+        top_k: int = 8,
+        query_vecs: np.ndarray | None = None,
+    ) -> List[Tuple[List[IndexRecord], np.ndarray]]:
+        """
+        Score several queries at once; returns one (records, scores) pair per
+        query, in input order.
+        why: one embed() call batches the encoder (GEMM-bound kernels run far
+        better at batch 32 than batch 1), and one Q @ matᵀ GEMM replaces
+        per-query matvecs — useful for multi-query expansion or re-ranking.
+        """
+        if not queries:
+            return []
+        if self.mat.shape[0] == 0:
+            return [([], np.array([], dtype=np.float32)) for _ in queries]
+        if query_vecs is not None:
+            Q = np.asarray(query_vecs, dtype=np.float32)
+        else:
+            Q = embedder.embed(list(queries)).astype(np.float32)
+        Q = Q / (np.linalg.norm(Q, axis=1, keepdims=True) + 1e-8)
+        if self.dtype == "int8":
+            S = (Q @ self.mat.T.astype(np.float32)) * (1.0 / _I8_SCALE)
+        else:
+            S = Q @ self.mat.T
+        k = min(top_k, S.shape[1])
+        # Per-row partial top-k, then order each row's k hits by score
+        # (partition on S directly — see search_with_scores).
+        part = np.argpartition(S, -k, axis=1)[:, -k:]
+        out: List[Tuple[List[IndexRecord], np.ndarray]] = []
+        for row, idx in zip(S, part):
+            idx = idx[np.argsort(row[idx])[::-1]]
+            out.append(([self._record(i) for i in idx], row[idx]))
+        return out
+
+    def to_faiss(self, faiss_path: Path) -> "FaissIndex":
+        """Build (and persist) an HNSW index over this index's matrix."""
+        mat = np.ascontiguousarray(self.mat, dtype=np.float32)
+        fidx = _faiss.IndexHNSWFlat(mat.shape[1], 32, _faiss.METRIC_INNER_PRODUCT)
+        fidx.add(mat)
+        _faiss.write_index(fidx, str(faiss_path))
+        return FaissIndex(self, fidx)
+
     def search_with_scores(
-        self, query: str, embedder: Embedder, top_k: int = 8
+        self,
+        query: str,
+        embedder: Embedder,
+        top_k: int = 8,
+        query_vec: np.ndarray | None = None,
     ) -> Tuple[List[IndexRecord], np.ndarray]:
-        """Return (records, scores). Helpful for debugging retrieval."""
+        """
+        Return (records, scores). Helpful for debugging retrieval.
+        Pass query_vec to reuse a precomputed embedding (e.g. from a cache).
+        """
         if self.mat.shape[0] == 0:
             return [], np.array([], dtype=np.float32)
-        q = embedder.embed_query(query).astype(np.float32)
+        if query_vec is not None:
+            q = np.asarray(query_vec, dtype=np.float32)
+        else:
+            q = embedder.embed_query(query).astype(np.float32)
         q = q / (np.linalg.norm(q) + 1e-8)
-        sims = self.mat @ q  # cosine similarity
+        # Rows are pre-normalized, so a dot product is cosine similarity.
+        # why: SimSIMD's batched dot uses wider SIMD kernels and skips the
+        # NumPy dispatch overhead that dominates small-D queries.
+        if self.dtype == "int8":
+            q_i8 = _quantize_i8(q)
+            if _simsimd is not None:
+                sims = np.asarray(_simsimd.dot(q_i8, self.mat), dtype=np.float32)
+            else:
+                sims = (self.mat.astype(np.int32) @ q_i8.astype(np.int32)).astype(np.float32)
+            sims *= 1.0 / (_I8_SCALE * _I8_SCALE)
+        elif self.dtype == "float16":
+            if _simsimd is not None:
+                # f16 kernel loads half the bytes and widens to f32 in-register
+                sims = np.asarray(
+                    _simsimd.dot(q.astype(np.float16), self.mat), dtype=np.float32
+                )
+            else:
+                sims = self.mat.astype(np.float32) @ q
+        elif _simsimd is not None:
+            sims = np.asarray(_simsimd.dot(q, self.mat), dtype=np.float32)
+        elif (
+            _njit is not None
+            and type(self.mat) is np.ndarray  # numba rejects memmap-backed mats
+            and self.mat.shape[0] >= _NUMBA_MIN_ROWS
+        ):
+            sims = _dot_rows(self.mat, q)
+        else:
+            sims = self.mat @ q
+        sims = sims.astype(np.float32, copy=False)
         k = min(top_k, sims.shape[0])
-        idx = np.argpartition(-sims, k - 1)[:k]
-        idx = idx[np.argsort(-sims[idx])]
-        return [self.records[i] for i in idx], sims[idx]
+        # why: partition on sims directly; negating first materialized two
+        # N-sized temporaries just to flip the order.
+        if k == 1:
+            idx = np.array([sims.argmax()])
+        else:
+            idx = np.argpartition(sims, -k)[-k:]
+            idx = idx[np.argsort(sims[idx])[::-1]]
+        return [self._record(i) for i in idx], sims[idx]
+
+
+# Brute force stays exact and fast enough below this size; HNSW pays off above.
+_FAISS_MIN_ROWS = 5000
+
+
+class FaissIndex:
+    """
+    HNSW ANN index over a SimpleIndex's rows; drop-in for its search API.
+    why: brute-force scoring is O(N·D) per query, while HNSW prunes the
+    graph to sub-linear work on large corpora.
+    """
+
+    def __init__(self, parent: SimpleIndex, faiss_index):
+        self.parent = parent  # metadata + record construction stay SoA
+        self.index = faiss_index
+
+    def size(self) -> int:
+        return self.parent.size()
+
+    def search(
+        self,
+        query: str,
+        embedder: Embedder,
+        top_k: int = 8,
+        query_vec: np.ndarray | None = None,
+    ) -> List[IndexRecord]:
+        results, _ = self.search_with_scores(query, embedder, top_k, query_vec=query_vec)
+        return results
+
+    def search_with_scores(
+        self,
+        query: str,
+        embedder: Embedder,
+        top_k: int = 8,
+        query_vec: np.ndarray | None = None,
+    ) -> Tuple[List[IndexRecord], np.ndarray]:
+        if self.size() == 0:
+            return [], np.array([], dtype=np.float32)
+        if query_vec is not None:
+            q = np.asarray(query_vec, dtype=np.float32)
+        else:
+            q = embedder.embed_query(query).astype(np.float32)
+        q = q / (np.linalg.norm(q) + 1e-8)
+        k = min(top_k, self.size())
+        scores, ids = self.index.search(q[None, :], k)
+        keep = ids[0] >= 0  # HNSW pads missing neighbors with -1
+        return [self.parent._record(i) for i in ids[0][keep]], scores[0][keep]
+
+
+def maybe_wrap_faiss(index: SimpleIndex, faiss_path: Path):
+    """
+    Wrap a loaded SimpleIndex in a persisted HNSW index when it's large
+    enough to benefit. Returns the SimpleIndex unchanged when faiss is
+    missing, the corpus is small, or the matrix is quantized.
+    """
+    if _faiss is None or index.size() < _FAISS_MIN_ROWS or index.dtype == "int8":
+        return index
+    try:
+        if faiss_path.exists():
+            fidx = _faiss.read_index(str(faiss_path), _faiss.IO_FLAG_MMAP)
+            if fidx.ntotal == index.size():
+                return FaissIndex(index, fidx)
+        return index.to_faiss(faiss_path)
+    except Exception as e:
+        print(f"[index] faiss index unavailable ({e}); using brute-force search")
+        return index
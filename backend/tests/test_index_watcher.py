@@ -0,0 +1,68 @@
+# file: backend/tests/test_index_watcher.py
+"""
+Regression check for the index watcher: pure reads of the index file
+(including _load_index's own read-back) must not re-arm the reload flag,
+or every chat request re-parses the index from disk.
+"""
+import importlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Watchdog delivers events asynchronously; generous for slow CI.
+_EVENT_WAIT_S = 0.8
+
+
+@pytest.fixture()
+def watched_main(tmp_path, monkeypatch):
+    index_path = tmp_path / "index.jsonl"
+    index_path.write_text("", encoding="utf-8")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("INDEX_PATH", str(index_path))
+    main = importlib.reload(importlib.import_module("main"))
+    if main.Observer is None:
+        pytest.skip("watchdog not installed")
+    main._start_index_watcher()
+    assert main._observer is not None
+    yield main
+    main._observer.stop()
+
+
+def test_write_arms_reload(watched_main):
+    main = watched_main
+    main._RELOAD_PENDING = False
+    main.INDEX_PATH.touch()
+    time.sleep(_EVENT_WAIT_S)
+    assert main._RELOAD_PENDING
+
+
+def test_pure_read_does_not_arm_reload(watched_main):
+    main = watched_main
+    main._RELOAD_PENDING = False
+    with main.INDEX_PATH.open("r", encoding="utf-8") as f:
+        f.read()
+    time.sleep(_EVENT_WAIT_S)
+    assert not main._RELOAD_PENDING
+
+
+def test_consecutive_freshness_checks_reload_at_most_once(watched_main, monkeypatch):
+    main = watched_main
+    main.INDEX_PATH.touch()
+    time.sleep(_EVENT_WAIT_S)
+    calls = []
+    real_load = main._load_index
+
+    def counting_load():
+        calls.append(1)
+        real_load()  # performs the read that used to re-arm the flag
+
+    monkeypatch.setattr(main, "_load_index", counting_load)
+    main._ensure_index_fresh()
+    time.sleep(_EVENT_WAIT_S)  # let any spurious events from the read arrive
+    main._ensure_index_fresh()
+    assert len(calls) == 1